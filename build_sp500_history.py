@@ -4,23 +4,29 @@ Created on Sat Jun 14 12:46:23 2025
 
 @author: Zheng_Wang
 
-To create a weekly historical S&P 500 ticker list from Jan 2022 to Jan 2025, for use as a filter to avoid survivorship bias in social sentiment scraping.
+To create a weekly historical S&P 500 ticker list from Dec 2020 to Jan 2025, for use as a filter to avoid survivorship bias in social sentiment scraping.
 
 """
 
 
 import pandas as pd
 from datetime import datetime, timedelta
+from io import StringIO
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Shared keep-alive session with retries for all HTTP fetches
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(max_retries=Retry(total=5, backoff_factor=0.5), pool_connections=16, pool_maxsize=16))
 
 # === Step 1: Get all S&P 500 additions/removals from Wikipedia ===
 url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
-page = requests.get(url)
-soup = BeautifulSoup(page.text, "html.parser")
+page = SESSION.get(url, timeout=10)
+page.raise_for_status()
+tables = pd.read_html(StringIO(page.text), flavor='lxml')
 
 # === Step 2: Get the current constituents table ===
-tables = pd.read_html(page.text)
 current_table = tables[0]
 current_sp500 = set(current_table['Symbol'].tolist())
 
@@ -31,57 +37,81 @@ ticker_to_name = dict(zip(current_table['Symbol'], current_table['Security']))
 changes_table = tables[1]
 changes_table.columns = ['date', 'added_tickers', 'added_names', 'removed_tickers', 'removed_names', 'notes']
 
+# Only the date and ticker/name columns are parsed; drop the free-text reason and rows with no changes
+changes_table = changes_table.drop(columns='notes').dropna(subset=['added_tickers', 'removed_tickers'], how='all')
+
+def explode_changes(ct, tickers_col, names_col, action):
+    """Splits comma-separated ticker/name cells into one row per (date, ticker, action, name)."""
+    rows = ct[['date', tickers_col, names_col]].dropna()
+    tickers = rows[tickers_col].astype(str).str.split(',').explode().str.strip().str.upper()
+    names = rows[names_col].astype(str).str.split(',').explode().str.strip()
+    # Pair the n-th ticker with the n-th name of the same row (extras are dropped, like zip)
+    tickers.index = pd.MultiIndex.from_arrays([tickers.index, tickers.groupby(level=0).cumcount()])
+    names.index = pd.MultiIndex.from_arrays([names.index, names.groupby(level=0).cumcount()])
+    paired = pd.concat({'ticker': tickers, 'name': names}, axis=1, join='inner').sort_index()
+    row = paired.index.get_level_values(0)
+    return pd.DataFrame({
+        'row': row,
+        'date': rows['date'].reindex(row).to_numpy(),
+        'ticker': paired['ticker'].to_numpy(),
+        'action': action,
+        'name': paired['name'].to_numpy(),
+    })
+
 # Parse change records into a list of (date, ticker, action, name)
-change_log = []
-for _, row in changes_table.iterrows():
-    try:
-        date = pd.to_datetime(row['date'])
-    except:
-        continue
-    if isinstance(row['added_tickers'], str):
-        added_tickers = [t.strip().upper() for t in row['added_tickers'].split(',')]
-        added_names = [n.strip() for n in row['added_names'].split(',')]
-        for t, n in zip(added_tickers, added_names):
-            change_log.append((date, t, 'ADD', n))
-            ticker_to_name[t] = n
-    if isinstance(row['removed_tickers'], str):
-        removed_tickers = [t.strip().upper() for t in row['removed_tickers'].split(',')]
-        removed_names = [n.strip() for n in row['removed_names'].split(',')]
-        for t, n in zip(removed_tickers, removed_names):
-            change_log.append((date, t, 'REMOVE', n))
-            ticker_to_name[t] = n
-
-# Sort chronologically
-change_log.sort(reverse=True)
-
-# === Step 4: Rebuild weekly constituent snapshots from Jan 2022 to Jan 2025 ===
-start_date = datetime(2022, 1, 3)
+ct = changes_table.assign(date=pd.to_datetime(changes_table['date'], errors='coerce', format='mixed')).dropna(subset=['date'])
+changes = pd.concat([
+    explode_changes(ct, 'added_tickers', 'added_names', 'ADD'),
+    explode_changes(ct, 'removed_tickers', 'removed_names', 'REMOVE'),
+]).sort_values('row', kind='stable')
+
+# Later rows win, matching the original row-by-row update order
+ticker_to_name.update(zip(changes['ticker'], changes['name']))
+change_log = list(changes[['date', 'ticker', 'action', 'name']].itertuples(index=False, name=None))
+
+# Sort newest first; the snapshot walk below consumes it through a pointer
+change_log = tuple(sorted(change_log, reverse=True))
+
+# === Step 4: Rebuild weekly constituent snapshots from Dec 2020 to Jan 2025 ===
+# Monday on or before the scraper's Config.HISTORICAL_START (2021-01-01), so every scraped week has a snapshot
+start_date = datetime(2020, 12, 28)
 end_date = datetime(2025, 1, 6)
 
 constituents = set(current_sp500)
 weekly_snapshots = []
 snapshot_date = end_date
+idx = 0
+dirty = True
 
 while snapshot_date >= start_date:
     # Apply changes in reverse (to backtrack from current list)
-    while change_log and change_log[0][0] > snapshot_date:
-        _, ticker, action, _ = change_log.pop(0)
+    while idx < len(change_log) and change_log[idx][0] > snapshot_date:
+        _, ticker, action, _ = change_log[idx]
+        idx += 1
+        dirty = True
         if action == 'ADD':
             constituents.discard(ticker)
         elif action == 'REMOVE':
             constituents.add(ticker)
 
+    # Most weeks have no changes (and none at all once the log is exhausted),
+    # so only re-sort and re-map names when the set actually changed
+    if dirty:
+        sorted_constituents = sorted(constituents)
+        constituent_names = [ticker_to_name.get(t, "NA") for t in sorted_constituents]
+        dirty = False
+
     snapshot = {
         'week_start': snapshot_date.strftime('%Y-%m-%d'),
-        'tickers': sorted(constituents),
-        'names': [ticker_to_name.get(t, "NA") for t in sorted(constituents)]
+        'tickers': sorted_constituents,
+        'names': constituent_names
     }
     weekly_snapshots.append(snapshot)
     snapshot_date -= timedelta(days=7)
 
-# === Step 5: Save to CSV ===
+# === Step 5: Save to Parquet (tickers/names stay native list columns) ===
 df_snapshots = pd.DataFrame(weekly_snapshots)
-df_snapshots.to_csv("historical_sp500_by_week.csv", index=False)
-print("✅ Saved: historical_sp500_by_week.csv")
+df_snapshots.to_parquet("historical_sp500_by_week.parquet", engine='pyarrow', compression='zstd', index=False)
+print("✅ Saved: historical_sp500_by_week.parquet")
 
 
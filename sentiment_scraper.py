@@ -16,18 +16,19 @@ This version has been refactored for clarity and maintainability.
 """
 
 # Standard library imports
-import ast
+import asyncio
 import json
 import re
 import time
-import warnings
 from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 # Third-party imports
+import ahocorasick
+import aiohttp
 import pandas as pd
-import praw
+import asyncpraw
 import spacy
 from spacy.matcher import PhraseMatcher
 
@@ -40,9 +41,9 @@ class Config:
     # Number of top tickers to select each week
     TOP_N_WEEKLY = 5
 
-    # Path to the CSV file containing weekly S&P 500 constituents
+    # Path to the Parquet file containing weekly S&P 500 constituents
     # IMPORTANT: Update this path to your local file location
-    SP500_CSV_PATH = r"C:\Users\YourUser\path\to\your\historical_sp500_by_week.csv"
+    SP500_PARQUET_PATH = r"C:\Users\YourUser\path\to\your\historical_sp500_by_week.parquet"
 
     # Subreddits to scrape for ticker mentions
     SUBREDDITS = ["stocks", "investing", "wallstreetbets", "SecurityAnalysis", "StockMarket"]
@@ -58,21 +59,230 @@ class Config:
     # Number of posts to fetch from each scraping method (e.g., top, controversial)
     MAX_POSTS_PER_METHOD = 500
 
+    # Listing methods to scrape on every subreddit
+    LISTING_METHODS = ["top", "hot", "new", "controversial"]
+
+    # Maximum number of requests in flight at once; this bounds concurrency only.
+    # The per-minute API quota is enforced by AsyncPRAW's own rate limiter.
+    MAX_CONCURRENT_REQUESTS = 8
+
+    # Maximum number of pooled keep-alive HTTP connections for Pushshift
+    HTTP_POOL_SIZE = 16
+
+    # Pushshift settings for time-bounded historical pulls
+    # (results are paged, so this only needs to stay within the server's per-request cap)
+    PUSHSHIFT_SUBMISSION_URL = "https://api.pushshift.io/reddit/search/submission"
+    PUSHSHIFT_PAGE_SIZE = 100
+
+    # spaCy model and batching for phrase matching
+    SPACY_MODEL = "en_core_web_sm"
+    NLP_BATCH_SIZE = 256
+
+    # Worker processes for nlp.pipe. Only the tokenizer runs, so one process is usually
+    # fastest; values > 1 need an `if __name__ == "__main__":` guard on Windows/macOS (spawn).
+    NLP_N_PROCESS = 1
+
     # Output directory for results
     OUTPUT_DIR = Path("reddit_weekly_data")
 
-# Suppress a common warning from PRAW in non-async environments
-warnings.filterwarnings("ignore", message="It appears that you are using PRAW in an asynchronous environment")
+def load_sp500_membership(config):
+    """Loads weekly S&P 500 snapshots as {week_start: frozenset(tickers)} plus a ticker -> name map."""
+    snapshots = pd.read_parquet(config.SP500_PARQUET_PATH, engine="pyarrow", columns=["week_start", "tickers", "names"])
+    membership = {}
+    ticker_to_name = {}
+    for row in snapshots.itertuples():
+        membership[pd.Timestamp(row.week_start)] = frozenset(row.tickers)
+        ticker_to_name.update(zip(row.tickers, row.names))
+    print(f"📚 Loaded {len(membership)} weekly S&P 500 snapshots.")
+    return membership, ticker_to_name
+
+def sp500_for_week(membership, week_start):
+    """Returns the S&P 500 members for the snapshot (a Monday) of the week containing `week_start`.
+
+    Raises KeyError if there is no snapshot for that week, rather than silently filtering out
+    every ticker; regenerate the snapshots to cover Config.HISTORICAL_START if this happens.
+    """
+    week_start = pd.Timestamp(week_start).normalize()
+    snapshot_date = week_start - pd.Timedelta(days=week_start.weekday())
+    try:
+        return membership[snapshot_date]
+    except KeyError:
+        raise KeyError(f"No S&P 500 snapshot for the week of {snapshot_date:%Y-%m-%d}; "
+                       f"snapshots cover {min(membership):%Y-%m-%d} to {max(membership):%Y-%m-%d}.") from None
 
 def initialize_reddit_client(config):
-    """Creates and returns an authenticated PRAW Reddit instance."""
+    """Creates and returns an AsyncPRAW Reddit instance (must be called inside the event loop)."""
     print("🔐 Authenticating with Reddit...")
     try:
-        reddit = praw.Reddit(
+        reddit = asyncpraw.Reddit(
             client_id=config.REDDIT_CLIENT_ID,
             client_secret=config.REDDIT_CLIENT_SECRET,
             user_agent=config.REDDIT_USER_AGENT,
             username=config.REDDIT_USERNAME,
             password=config.REDDIT_PASSWORD,
-            check_for_async=False
-        )
\ No newline at end of file
+        )
+        return reddit
+    except Exception as e:
+        print(f"❌ Failed to create Reddit client: {e}")
+        return None
+
+async def fetch_subreddit(reddit, semaphore, name, method, limit):
+    """Fetches up to `limit` posts from one listing (top, hot, ...) of a subreddit."""
+    async with semaphore:
+        try:
+            subreddit = await reddit.subreddit(name)
+            listing = getattr(subreddit, method)
+            # Only the ranked listings accept a time filter
+            kwargs = {"time_filter": "all"} if method in ("top", "controversial") else {}
+            return [post async for post in listing(limit=limit, **kwargs)]
+        except Exception as e:
+            print(f"⚠️ Failed to fetch r/{name}/{method}: {e}")
+            return []
+
+async def fetch_all_posts(reddit, config):
+    """Fetches every configured subreddit/listing pair concurrently and de-duplicates the posts."""
+    semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_REQUESTS)
+    results = await asyncio.gather(*[
+        fetch_subreddit(reddit, semaphore, name, method, config.MAX_POSTS_PER_METHOD)
+        for name in config.SUBREDDITS
+        for method in config.LISTING_METHODS
+    ])
+
+    # The same post often shows up in several listings
+    posts = {}
+    for batch in results:
+        for post in batch:
+            posts[post.id] = post
+    print(f"📥 Fetched {len(posts)} unique posts from {len(config.SUBREDDITS)} subreddits.")
+    return list(posts.values())
+
+def weekly_windows(config):
+    """Returns UTC Monday-to-Monday (week_start, week_end) pairs covering the historical date range."""
+    windows = []
+    week_start = config.HISTORICAL_START.replace(tzinfo=timezone.utc)
+    # Snap to Monday to match the S&P 500 snapshots and the backtester's calendar weeks
+    week_start -= timedelta(days=week_start.weekday())
+    historical_end = config.HISTORICAL_END.replace(tzinfo=timezone.utc)
+    while week_start < historical_end:
+        week_end = min(week_start + timedelta(days=7), historical_end)
+        windows.append((week_start, week_end))
+        week_start = week_end
+    return windows
+
+async def fetch_pushshift_ids(session, semaphore, config, subreddit, week_start, week_end):
+    """Returns the fullnames of all submissions posted to a subreddit within [week_start, week_end).
+
+    Pushshift returns the newest posts first, so the window is paged backwards by moving
+    `before` to the oldest post of each page until a short page comes back.
+    """
+    after = int(week_start.timestamp())
+    before = int(week_end.timestamp())
+    fullnames = {}
+    while True:
+        params = {
+            "subreddit": subreddit,
+            "after": after,
+            "before": before,
+            "size": config.PUSHSHIFT_PAGE_SIZE,
+            "sort": "desc",
+            "sort_type": "created_utc",
+            "fields": "id,created_utc",
+        }
+        async with semaphore:
+            try:
+                async with session.get(config.PUSHSHIFT_SUBMISSION_URL, params=params) as response:
+                    response.raise_for_status()
+                    payload = await response.json()
+            except aiohttp.ClientError as e:
+                print(f"⚠️ Pushshift query failed for r/{subreddit} ({week_start:%Y-%m-%d}), "
+                      f"keeping {len(fullnames)} posts fetched so far: {e}")
+                break
+
+        page = payload.get("data", [])
+        for item in page:
+            fullnames[f"t3_{item['id']}"] = None
+        if len(page) < config.PUSHSHIFT_PAGE_SIZE:
+            break
+
+        # Re-include the oldest second so posts sharing it are not skipped (duplicates are
+        # collapsed above); if the whole page shares one second, step past it instead
+        oldest = min(int(item["created_utc"]) for item in page)
+        before = oldest + 1 if oldest + 1 < before else oldest
+    return list(fullnames)
+
+async def hydrate_submissions(reddit, semaphore, fullnames):
+    """Loads full submission objects from Reddit for IDs returned by Pushshift."""
+    if not fullnames:
+        return []
+    async with semaphore:
+        try:
+            return [post async for post in reddit.info(fullnames=fullnames)]
+        except Exception as e:
+            print(f"⚠️ Failed to hydrate {len(fullnames)} Pushshift posts: {e}")
+            return []
+
+async def fetch_weekly_posts_pushshift(reddit, config):
+    """Fetches each week's posts via Pushshift time-range queries, hydrated through Reddit."""
+    semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_REQUESTS)
+
+    async def fetch_week(session, week_start, week_end):
+        id_batches = await asyncio.gather(*[
+            fetch_pushshift_ids(session, semaphore, config, name, week_start, week_end)
+            for name in config.SUBREDDITS
+        ])
+        fullnames = [fullname for batch in id_batches for fullname in batch]
+        return week_start, await hydrate_submissions(reddit, semaphore, fullnames)
+
+    connector = aiohttp.TCPConnector(limit=config.HTTP_POOL_SIZE)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        results = await asyncio.gather(*[
+            fetch_week(session, week_start, week_end)
+            for week_start, week_end in weekly_windows(config)
+        ])
+
+    print(f"📥 Fetched Pushshift posts for {len(results)} weeks.")
+    return dict(results)
+
+def load_nlp(config):
+    """Loads the spaCy model with every pipeline component disabled, leaving only the tokenizer."""
+    return spacy.load(config.SPACY_MODEL, disable=["tok2vec", "tagger", "parser", "ner", "lemmatizer", "attribute_ruler"])
+
+def build_name_matcher(nlp, tickers, names):
+    """Builds a PhraseMatcher that maps full company names to their ticker."""
+    matcher = PhraseMatcher(nlp.vocab)
+    for ticker, name in zip(tickers, names):
+        if name and name != "NA":
+            matcher.add(ticker, [nlp.make_doc(name)])
+    return matcher
+
+def build_ticker_automaton(tickers):
+    """Builds an Aho-Corasick automaton that finds every ticker symbol in one pass over a text."""
+    automaton = ahocorasick.Automaton()
+    for i, ticker in enumerate(tickers):
+        automaton.add_word(ticker, (i, ticker))
+    automaton.make_automaton()
+    return automaton
+
+def scan_tickers(automaton, text, counts):
+    """Adds whole-word ticker symbol hits in `text` to `counts`."""
+    for end, (_, ticker) in automaton.iter(text):
+        start = end - len(ticker) + 1
+        # Skip hits inside longer words, e.g. "IT" in "WITH"
+        if start > 0 and text[start - 1].isalnum():
+            continue
+        if end + 1 < len(text) and text[end + 1].isalnum():
+            continue
+        counts[ticker] += 1
+
+def count_mentions(nlp, name_matcher, automaton, posts, config):
+    """Counts ticker mentions per post: symbols via Aho-Corasick, company names via spaCy."""
+    texts = [(f"{post.title}\n{post.selftext}", post.id) for post in posts]
+
+    mentions = {}
+    for doc, post_id in nlp.pipe(texts, as_tuples=True, batch_size=config.NLP_BATCH_SIZE, n_process=config.NLP_N_PROCESS):
+        counts = defaultdict(int)
+        scan_tickers(automaton, doc.text, counts)
+        for match_id, _, _ in name_matcher(doc):
+            counts[nlp.vocab.strings[match_id]] += 1
+        mentions[post_id] = counts
+    return mentions
@@ -10,11 +10,17 @@ trading strategy, and calculates key performance metrics against benchmarks (SPY
 @author: Zheng_Wang
 """
 
+import argparse
+
+import joblib
 import pandas as pd
 import yfinance as yf
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Non-interactive backend: charts are saved to PNG, never shown
 import matplotlib.pyplot as plt
 import matplotlib.style as style
+from numba import njit, prange
 from pathlib import Path
 
 # === Configuration ===
@@ -26,39 +32,99 @@ SELECTIONS_CSV_PATH = "reddit_weekly_data/weekly_top5_tickers_detailed_20250626_
 INITIAL_CAPITAL = 100_000
 BENCHMARKS = ['SPY', 'QQQ']
 
+# --- Price Cache ---
+# Downloaded price frames are memoized in-process and persisted here so reruns skip the network.
+# Set to None to keep the in-process cache only (or run with --no-cache to bypass both).
+YF_CACHE_DIR = "./.yf_cache"
+
 # === Helper Functions ===
 
-def get_trading_dates(week_start, week_end):
-    """Gets the first and last trading day within a calendar week."""
-    # Create a daily date range for the given week
-    date_range = pd.to_datetime(pd.date_range(start=week_start, end=week_end))
-    
-    # Fetch SPY data for the week to identify actual trading days
-    spy_data = yf.download('SPY', start=date_range.min() - pd.Timedelta(days=3), end=date_range.max() + pd.Timedelta(days=3), progress=False)
-    
-    # Filter for dates that were actual trading days
-    trading_days_in_week = spy_data[spy_data.index.isin(date_range)]
-    
-    if not trading_days_in_week.empty:
-        return trading_days_in_week.index.min(), trading_days_in_week.index.max()
-    return None, None
+_price_memo = {}
+
+# Substrings of yfinance error messages that mean "try again later" rather than "no data"
+_TRANSIENT_ERRORS = ('rate limit', 'too many requests', 'timed out', 'timeout', 'connection')
+
+def _transient_failures():
+    """Returns the tickers whose last yf.download failed for a transient reason (e.g. rate limiting)."""
+    # _ERRORS is yfinance-internal, so tolerate it moving or disappearing
+    errors = getattr(getattr(yf, 'shared', None), '_ERRORS', None) or {}
+    return sorted(t for t, msg in errors.items() if any(e in str(msg).lower() for e in _TRANSIENT_ERRORS))
+
+def _empty_tickers(prices):
+    """Returns the tickers that came back without a single price (typically delisted names)."""
+    if prices.empty:
+        return []
+    closes = prices['Close']
+    return sorted(closes.columns[closes.isna().all()])
+
+def download_prices(tickers, start, end, auto_adjust=False, use_cache=True):
+    """Cached wrapper around yf.download keyed on (tickers, start, end).
+
+    Returns a copy, so callers are free to modify it. Tickers without any prices (e.g. delisted
+    former members) are cached along with the rest of the frame, but downloads that hit a
+    transient failure such as a rate limit are never cached.
+    """
+    start_iso = pd.Timestamp(start).strftime('%Y-%m-%d')
+    end_iso = pd.Timestamp(end).strftime('%Y-%m-%d')
+    key = (tuple(sorted(tickers)), start_iso, end_iso, auto_adjust)
+
+    if use_cache and key in _price_memo:
+        return _price_memo[key].copy()
+
+    cache_file = Path(YF_CACHE_DIR) / f"{joblib.hash(key)}.pkl" if use_cache and YF_CACHE_DIR else None
+    if cache_file is not None and cache_file.exists():
+        prices, empty_tickers = joblib.load(cache_file)
+    else:
+        prices = yf.download(list(key[0]), start=start_iso, end=end_iso, progress=False, threads=True, auto_adjust=auto_adjust)
+        failed = _transient_failures()
+        if prices.empty or failed:
+            if use_cache:
+                print(f"WARNING: Download hit a transient error ({', '.join(failed) or 'no data returned'}); it will not be cached.")
+            return prices
+        empty_tickers = _empty_tickers(prices)
+        if cache_file is not None:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            joblib.dump((prices, empty_tickers), cache_file)
+
+    if empty_tickers:
+        print(f"Note: no price data for {len(empty_tickers)} ticker(s): {', '.join(empty_tickers)}")
+    if use_cache:
+        _price_memo[key] = prices
+    return prices.copy()
+
+@njit("float64[:](float32[:, :], float32[:, :], boolean[:, :])", parallel=True)
+def _weekly_returns(opens, closes, mask):
+    """Equal-weight open-to-close return of the selected tickers for each week (NaN if none traded)."""
+    W, T = opens.shape
+    out = np.empty(W, np.float64)
+    for w in prange(W):
+        s, n = 0.0, 0
+        for t in range(T):
+            # NaN opens fail the > 0 test; NaN closes are skipped explicitly
+            if mask[w, t] and opens[w, t] > 0 and not np.isnan(closes[w, t]):
+                s += (closes[w, t] - opens[w, t]) / opens[w, t]
+                n += 1
+        out[w] = s / n if n else np.nan
+    return out
 
 def calculate_metrics(returns_df, risk_free_rate=0.0):
     """Calculates all requested performance metrics."""
     metrics = {}
     weeks_per_year = 52
+    # Upcast so the summary statistics are accumulated in float64
+    r = np.ascontiguousarray(returns_df.to_numpy(dtype=np.float64))
 
-    # Weekly Return: Mean and Volatility
-    metrics['mean_weekly_return'] = returns_df.mean()
-    metrics['weekly_volatility'] = returns_df.std()
+    # Weekly Return: Mean and Volatility (sample std, as pandas computes it)
+    metrics['mean_weekly_return'] = r.mean()
+    metrics['weekly_volatility'] = r.std(ddof=1)
 
     # Cumulative Return
-    cumulative_returns = (1 + returns_df).cumprod()
-    metrics['cumulative_return'] = cumulative_returns
+    cum = np.cumprod(1 + r)
+    metrics['cumulative_return'] = pd.Series(cum, index=returns_df.index)
 
     # CAGR (Compounded Annual Growth Rate)
-    total_return = cumulative_returns.iloc[-1]
-    years = len(returns_df) / weeks_per_year
+    total_return = cum[-1]
+    years = len(r) / weeks_per_year
     metrics['cagr'] = (total_return ** (1 / years)) - 1
 
     # Sharpe Ratio (Annualized)
@@ -66,16 +132,16 @@ def calculate_metrics(returns_df, risk_free_rate=0.0):
     metrics['sharpe_ratio'] = sharpe * np.sqrt(weeks_per_year)
 
     # Max Drawdown
-    rolling_max = cumulative_returns.cummax()
-    drawdown = (cumulative_returns - rolling_max) / rolling_max
+    peak = np.maximum.accumulate(cum)
+    drawdown = (cum - peak) / peak
     metrics['max_drawdown'] = drawdown.min()
 
     return metrics
 
 # === Main Execution ===
 
-def run_backtest():
-    """Main function to run the backtest and generate the analysis."""
+def run_backtest(plot=False, use_cache=True):
+    """Main function to run the backtest and generate the analysis (and the growth chart if `plot`)."""
     print("Starting Backtest and Performance Analysis...")
     
     # --- 1. Load Data ---
@@ -93,61 +159,71 @@ def run_backtest():
     
     print(f"📈 Found {len(weekly_groups)} weeks of ticker selections to process.")
 
-    # --- 2. Run Trading Simulation ---
-    portfolio_weekly_returns = []
-    processed_weeks = []
+    # --- 2. Fetch Price Data ---
+    # A single batched download for every selected ticker plus the benchmarks;
+    # each week is then sliced out of this frame instead of hitting Yahoo again.
+    all_tickers = sorted(set(df['ticker']).union(BENCHMARKS))
+    prices = download_prices(
+        all_tickers,
+        start=df['week_start'].min() - pd.Timedelta(days=5),
+        end=df['week_end'].max() + pd.Timedelta(days=5),
+        use_cache=use_cache,
+    )
+    # Prices only carry ~6 significant digits, so float32 halves the memory traffic losslessly
+    prices = prices.astype({c: 'float32' for c in prices.select_dtypes('float64').columns})
+    trading_days = prices.index
 
-    for week_start, group in weekly_groups:
-        week_end = group['week_end'].iloc[0]
-        tickers = group['ticker'].tolist()
-        
-        buy_date, sell_date = get_trading_dates(week_start, week_end)
-        
-        if not buy_date or not sell_date or buy_date == sell_date:
-            continue # Skip weeks with no valid trading days
-            
-        # Fetch data for the tickers for the week
-        data = yf.download(tickers, start=buy_date, end=sell_date + pd.Timedelta(days=1), progress=False)
-        
-        if data.empty or 'Open' not in data.columns or 'Close' not in data.columns:
-            continue
+    # Plain arrays with a shared ticker axis so weeks can be picked out by position
+    ticker_columns = prices['Open'].columns
+    opens_arr = prices['Open'].to_numpy()
+    closes_arr = prices['Close'].reindex(columns=ticker_columns).to_numpy()
 
-        # Get prices for the trading rule
-        open_prices = data['Open'].loc[buy_date]
-        close_prices = data['Close'].loc[sell_date]
-        
-        # Handle cases where some tickers might not have data for the specific day
-        valid_tickers = open_prices.dropna().index.intersection(close_prices.dropna().index)
-        if valid_tickers.empty:
-            continue
-            
-        open_prices = open_prices[valid_tickers]
-        close_prices = close_prices[valid_tickers]
-        
-        # Calculate weekly return for each stock and average for the portfolio
-        weekly_ticker_returns = (close_prices - open_prices) / open_prices
-        week_portfolio_return = weekly_ticker_returns.mean()
-        
-        portfolio_weekly_returns.append(week_portfolio_return)
-        processed_weeks.append(week_start)
+    print(f"Downloaded price history for {len(all_tickers)} tickers.")
+
+    # --- 3. Run Trading Simulation ---
+    buy_sell = weekly_groups.agg(week_end=('week_end', 'first'))
 
-    portfolio_returns = pd.Series(portfolio_weekly_returns, index=pd.to_datetime(processed_weeks)).rename("Portfolio")
+    # First and last trading day within each calendar week
+    buy_pos = trading_days.searchsorted(buy_sell.index)
+    sell_pos = trading_days.searchsorted(buy_sell['week_end'], side='right') - 1
     
-    print("Trading simulation complete.")
+    # Skip weeks with fewer than two valid trading days
+    valid_weeks = sell_pos > buy_pos
+    buy_sell = buy_sell[valid_weeks]
+
+    # Get prices for the trading rule, one row per week
+    opens = opens_arr[buy_pos[valid_weeks]]
+    closes = closes_arr[sell_pos[valid_weeks]]
+
+    # mask[week_i, ticker_j] is True when ticker j was selected in week i
+    mask = np.zeros(opens.shape, dtype=bool)
+    week_idx = buy_sell.index.get_indexer(df['week_start'])
+    ticker_idx = ticker_columns.get_indexer(df['ticker'])
+    selected = (week_idx >= 0) & (ticker_idx >= 0)
+    mask[week_idx[selected], ticker_idx[selected]] = True
+
+    # Equal-weight average over the selected tickers that have both prices;
+    # weeks where none of them traded come out as NaN and are dropped
+    week_portfolio_returns = _weekly_returns(opens, closes, mask)
 
-    # --- 3. Fetch Benchmark Data ---
-    start_date = portfolio_returns.index.min()
-    end_date = portfolio_returns.index.max() + pd.Timedelta(days=7) # Add buffer
+    portfolio_returns = pd.Series(week_portfolio_returns, index=buy_sell.index).dropna().rename("Portfolio")
     
-    benchmark_data = yf.download(BENCHMARKS, start=start_date, end=end_date, progress=False, auto_adjust=True)['Close']
-    benchmark_returns = benchmark_data.resample('W-MON').ffill().pct_change().dropna()
+    print("Trading simulation complete.")
+
+    # --- 4. Benchmark Returns ---
+    # Same rule and rows as the portfolio: open on the week's first trading day to close
+    # on its last, so each benchmark row covers exactly the week it is labelled with
+    bench_idx = ticker_columns.get_indexer(BENCHMARKS)
+    bench_opens = opens[:, bench_idx].astype(np.float64)
+    bench_closes = closes[:, bench_idx].astype(np.float64)
+    benchmark_returns = pd.DataFrame((bench_closes - bench_opens) / bench_opens, index=buy_sell.index, columns=BENCHMARKS)
     
     # Align data
     analysis_df = pd.concat([portfolio_returns, benchmark_returns], axis=1).dropna()
     
-    print("Benchmark data fetched and aligned.")
+    print("Benchmark returns computed and aligned.")
     
-    # --- 4. Calculate Performance Metrics ---
+    # --- 5. Calculate Performance Metrics ---
     portfolio_metrics = calculate_metrics(analysis_df['Portfolio'])
     spy_metrics = calculate_metrics(analysis_df['SPY'])
     qqq_metrics = calculate_metrics(analysis_df['QQQ'])
@@ -158,7 +234,7 @@ def run_backtest():
     
     print("Performance metrics calculated.")
 
-    # --- 5. Display Results ---
+    # --- 6. Display Results ---
     print("\n" + "="*50)
     print("PERFORMANCE ANALYSIS RESULTS")
     print("="*50)
@@ -193,25 +269,29 @@ def run_backtest():
     print(results_summary.to_string())
     print("\n" + "="*50)
 
-    # --- 6. Plot Cumulative Returns ($100 Growth) ---
-    style.use('seaborn-v0_8-darkgrid')
-    growth_df = 100 * portfolio_metrics['cumulative_return']
-    spy_growth = 100 * spy_metrics['cumulative_return']
-    qqq_growth = 100 * qqq_metrics['cumulative_return']
+    # --- 7. Plot Cumulative Returns ($100 Growth) ---
+    if plot:
+        style.use('seaborn-v0_8-darkgrid')
+        growth_df = 100 * portfolio_metrics['cumulative_return']
+        spy_growth = 100 * spy_metrics['cumulative_return']
+        qqq_growth = 100 * qqq_metrics['cumulative_return']
 
-    plt.figure(figsize=(14, 8))
-    plt.plot(growth_df.index, growth_df, label='Reddit Portfolio', linewidth=2.5)
-    plt.plot(spy_growth.index, spy_growth, label='SPY (S&P 500)', linestyle='--')
-    plt.plot(qqq_growth.index, qqq_growth, label='QQQ (Nasdaq-100)', linestyle='--')
+        plt.figure(figsize=(14, 8))
+        plt.plot(growth_df.index, growth_df, label='Reddit Portfolio', linewidth=2.5)
+        plt.plot(spy_growth.index, spy_growth, label='SPY (S&P 500)', linestyle='--')
+        plt.plot(qqq_growth.index, qqq_growth, label='QQQ (Nasdaq-100)', linestyle='--')
     
-    plt.title('Growth of $100 Investment', fontsize=18)
-    plt.ylabel('Portfolio Value ($)', fontsize=12)
-    plt.xlabel('Date', fontsize=12)
-    plt.legend(fontsize=12)
-    plt.figtext(0.1, 0.02, f"Analysis based on selections from '{selections_path.name}'", ha="left", fontsize=8, color='gray')
-    plt.show()
-
-    # --- 7. Conclusion ---
+        plt.title('Growth of $100 Investment', fontsize=18)
+        plt.ylabel('Portfolio Value ($)', fontsize=12)
+        plt.xlabel('Date', fontsize=12)
+        plt.legend(fontsize=12)
+        plt.figtext(0.1, 0.02, f"Analysis based on selections from '{selections_path.name}'", ha="left", fontsize=8, color='gray')
+        chart_path = selections_path.with_suffix('.png')
+        plt.savefig(chart_path, dpi=100, bbox_inches='tight')
+        plt.close()
+        print(f"Growth chart saved to '{chart_path}'.")
+
+    # --- 8. Conclusion ---
     print("\nCONCLUSION:")
     portfolio_cagr = portfolio_metrics['cagr']
     spy_cagr = spy_metrics['cagr']
@@ -244,4 +324,8 @@ def run_backtest():
 
 
 if __name__ == "__main__":
-    run_backtest()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Backtest weekly Reddit ticker selections against SPY and QQQ.")
+    parser.add_argument('--plot', action='store_true', help="Save the growth-of-$100 chart next to the selections CSV.")
+    parser.add_argument('--no-cache', action='store_true', help="Always download fresh prices and skip the price cache.")
+    args = parser.parse_args()
+    run_backtest(plot=args.plot, use_cache=not args.no_cache)
\ No newline at end of file